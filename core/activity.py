@@ -0,0 +1,53 @@
+# core/activity.py
+# Coalesced last_activity_at writes: authenticated requests only note activity in
+# memory and a background task flushes the latest stamp per user in one UPDATE.
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime
+
+from sqlalchemy import bindparam, update
+
+from db.database import SessionLocal
+from db.models import User
+
+log = logging.getLogger("uvicorn.error")
+
+ACTIVITY_FLUSH_INTERVAL = 5  # seconds
+
+_activity_buffer: dict[int, datetime] = {}
+_users = User.__table__
+_bump_activity = (
+    update(_users)
+    .where(_users.c.id == bindparam("uid"))
+    .values(last_activity_at=bindparam("ts"))
+)
+
+def record_activity(user_id: int) -> None:
+    _activity_buffer[user_id] = datetime.utcnow()
+
+async def flush_activity() -> int:
+    global _activity_buffer
+    if not _activity_buffer:
+        return 0
+    # swap before the first await so requests keep writing into a fresh dict
+    pending, _activity_buffer = _activity_buffer, {}
+    try:
+        async with SessionLocal() as db:
+            await db.execute(_bump_activity, [{"uid": uid, "ts": ts} for uid, ts in pending.items()])
+            await db.commit()
+    except Exception:
+        # keep the stamps for the next round unless a newer one already arrived
+        for uid, ts in pending.items():
+            _activity_buffer.setdefault(uid, ts)
+        raise
+    return len(pending)
+
+async def activity_flush_loop():
+    while True:
+        await asyncio.sleep(ACTIVITY_FLUSH_INTERVAL)
+        try:
+            await flush_activity()
+        except Exception as e:
+            log.exception("Activity flush error: %s", e)
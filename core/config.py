@@ -1,16 +1,24 @@
-from pydantic import BaseModel
+from dataclasses import dataclass
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
-class Settings(BaseModel):
+# Plain frozen dataclass: values are read from the environment once at import,
+# and attribute access is a slot read with no validation layer.
+@dataclass(frozen=True, slots=True)
+class Settings:
     SECRET_KEY: str = os.getenv("SECRET_KEY", "dev-secret")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
     REFRESH_INACTIVITY_DAYS: int = int(os.getenv("REFRESH_INACTIVITY_DAYS", "30"))
     ACCOUNT_DELETE_AFTER_LOGOUT_DAYS: int = int(os.getenv("ACCOUNT_DELETE_AFTER_LOGOUT_DAYS", "180"))
+    RUN_JANITOR: bool = os.getenv("RUN_JANITOR", "true").lower() == "true"
 
     DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "20"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "40"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
 
     CORS_ALLOW_ORIGINS: str = os.getenv("CORS_ALLOW_ORIGINS", "*")
 
@@ -18,8 +26,8 @@ class Settings(BaseModel):
     GDRIVE_FOLDER_ID: str = os.getenv("GDRIVE_FOLDER_ID", "")
     GDRIVE_SHARE_PUBLIC: bool = os.getenv("GDRIVE_SHARE_PUBLIC", "false").lower() == "true"
 
-    DEBUG: bool = os.getenv("DEBUG", "false").lower() == "true"
+    DEFAULT_COUNTRY: str = os.getenv("DEFAULT_COUNTRY", "IN")
 
-DEFAULT_COUNTRY: str = os.getenv("DEFAULT_COUNTRY", "IN")
+    DEBUG: bool = os.getenv("DEBUG", "false").lower() == "true"
 
 settings = Settings()
\ No newline at end of file
@@ -3,30 +3,56 @@ from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
 from core.config import settings
-import io
+from functools import lru_cache
+from typing import BinaryIO
+import threading
 
 SCOPES = ["https://www.googleapis.com/auth/drive.file"]
+FILE_FIELDS = "id,name,webViewLink,webContentLink,mimeType"
+RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+_svc_lock = threading.Lock()
+_local = threading.local()
 
-def _svc():
+@lru_cache(maxsize=1)
+def _credentials():
     if not settings.GDRIVE_SERVICE_ACCOUNT_FILE:
         raise RuntimeError("GDRIVE_SERVICE_ACCOUNT_FILE not set")
-    creds = service_account.Credentials.from_service_account_file(
+    return service_account.Credentials.from_service_account_file(
         settings.GDRIVE_SERVICE_ACCOUNT_FILE, scopes=SCOPES
     )
-    return build("drive", "v3", credentials=creds, cache_discovery=False)
 
-def upload_bytes_to_drive(filename: str, data: bytes, mime_type: str, folder_id: str | None = None) -> dict:
+def _svc():
+    # Credentials are loaded once per process. The client sits on httplib2, which is not
+    # thread-safe, so each worker thread builds and then reuses its own.
+    drive = getattr(_local, "drive", None)
+    if drive is None:
+        with _svc_lock:
+            creds = _credentials()
+        drive = _local.drive = build("drive", "v3", credentials=creds, cache_discovery=False)
+    return drive
+
+def upload_stream_to_drive(filename: str, stream: BinaryIO, mime_type: str, size: int | None = None, folder_id: str | None = None) -> dict:
     drive = _svc()
     meta = {"name": filename}
     parent = folder_id or settings.GDRIVE_FOLDER_ID
     if parent:
         meta["parents"] = [parent]
-    media = MediaIoBaseUpload(io.BytesIO(data), mimetype=mime_type, resumable=False)
-    file = drive.files().create(body=meta, media_body=media, fields="id,name,webViewLink,webContentLink,mimeType").execute()
+    # Small files go up in one request; larger (or unknown-size) ones are sent in chunks
+    # straight from the stream so they are never fully buffered in memory.
+    if size is not None and size < RESUMABLE_THRESHOLD:
+        media = MediaIoBaseUpload(stream, mimetype=mime_type, resumable=False)
+        file = drive.files().create(body=meta, media_body=media, fields=FILE_FIELDS).execute()
+    else:
+        media = MediaIoBaseUpload(stream, mimetype=mime_type, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+        request = drive.files().create(body=meta, media_body=media, fields=FILE_FIELDS)
+        file = None
+        while file is None:
+            _, file = request.next_chunk()
     if settings.GDRIVE_SHARE_PUBLIC:
         try:
             drive.permissions().create(fileId=file["id"], body={"role":"reader","type":"anyone"}).execute()
-            file = drive.files().get(fileId=file["id"], fields="id,name,webViewLink,webContentLink,mimeType").execute()
+            file = drive.files().get(fileId=file["id"], fields=FILE_FIELDS).execute()
         except Exception:
             pass
     return file
\ No newline at end of file
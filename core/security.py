@@ -1,36 +1,138 @@
-from datetime import datetime, timedelta
+from __future__ import annotations
+from datetime import datetime, timezone
+import asyncio
+import hashlib
+import hmac
+import threading
+import time
+import bcrypt
 import jwt
-from jwt import ExpiredSignatureError, InvalidTokenError
-from passlib.context import CryptContext
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from jwt import InvalidTokenError
+from cachetools import TTLCache
 from core.config import settings
 import uuid
 
 ALGORITHM = "HS256"
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# argon2id for new hashes. Its C core releases the GIL, so worker threads hash in parallel.
+_ph = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=1)
+# Legacy bcrypt hashes (including passlib's) still verify and are upgraded on login.
+_BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+
+# Verified payloads keyed by a truncated SHA-256 of the token (raw tokens are never stored).
+# Each entry carries the token's own exp so nothing is served past expiry.
+JWT_CACHE_TTL = 60
+# header.payload.signature; ours are a few hundred bytes, anything far longer is junk
+MAX_TOKEN_LENGTH = 4096
+REQUIRED_CLAIMS = ["exp", "sub", "type"]
+_jwt_cache: TTLCache = TTLCache(maxsize=10_000, ttl=JWT_CACHE_TTL)
+_jwt_cache_lock = threading.Lock()
+
+# Sessions ended by logout, mapped to the monotonic time they can be forgotten. Access tokens
+# carry their session in "sid" and live at most ACCESS_TOKEN_EXPIRE_MINUTES, so that is the
+# only reason an entry leaves: a size-bounded cache would evict under load and un-revoke.
+REVOKE_TTL = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+REVOKE_PRUNE_INTERVAL = 60  # seconds
+_revoked_sessions: dict[str, float] = {}
+_next_revoke_prune = 0.0
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return _ph.hash(password)
 
 def verify_password(password: str, password_hash: str) -> bool:
-    return pwd_context.verify(password, password_hash)
+    if not password_hash:
+        return False
+    if password_hash.startswith(_BCRYPT_PREFIXES):
+        try:
+            return bcrypt.checkpw(password.encode()[:72], password_hash.encode())
+        except ValueError:
+            return False
+    try:
+        return _ph.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+def password_needs_rehash(password_hash: str) -> bool:
+    return password_hash.startswith(_BCRYPT_PREFIXES) or _ph.check_needs_rehash(password_hash)
 
-def create_access_token(sub: str) -> str:
-    exp = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    payload = {"sub": sub, "type": "access", "exp": exp, "iat": datetime.utcnow()}
+# Hashing is CPU-bound; run it in the default thread pool so it never blocks the event loop.
+async def hash_password_async(password: str) -> str:
+    return await asyncio.to_thread(hash_password, password)
+
+async def verify_password_async(password: str, password_hash: str) -> bool:
+    return await asyncio.to_thread(verify_password, password, password_hash)
+
+def create_access_token(sub: str, uid: int | None = None, sid: str | None = None) -> str:
+    now = int(time.time())
+    exp = now + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    payload = {"sub": sub, "type": "access", "exp": exp, "iat": now}
+    if uid is not None:
+        payload["uid"] = uid
+    if sid is not None:
+        payload["sid"] = sid
     return jwt.encode(payload, settings.SECRET_KEY, algorithm=ALGORITHM)
 
 def create_refresh_token(sub: str):
     """Returns (token, jti, exp). Payload exp is informational; sliding expiry is enforced in DB."""
     jti = str(uuid.uuid4())
-    exp = datetime.utcnow() + timedelta(days=settings.REFRESH_INACTIVITY_DAYS)
-    payload = {"sub": sub, "type": "refresh", "jti": jti, "exp": exp, "iat": datetime.utcnow()}
+    now = int(time.time())
+    exp = now + settings.REFRESH_INACTIVITY_DAYS * 24 * 60 * 60
+    payload = {"sub": sub, "type": "refresh", "jti": jti, "exp": exp, "iat": now}
     token = jwt.encode(payload, settings.SECRET_KEY, algorithm=ALGORITHM)
-    return token, jti, exp
+    return token, jti, datetime.fromtimestamp(exp, timezone.utc).replace(tzinfo=None)
+
+def hash_refresh_token(token: str) -> str:
+    # Refresh tokens are random and high-entropy, so a keyed hash is enough; no KDF stretching.
+    return hmac.new(settings.SECRET_KEY.encode(), token.encode(), hashlib.sha256).hexdigest()
+
+def verify_refresh_token(token: str, token_hash: str) -> bool:
+    return hmac.compare_digest(hash_refresh_token(token), token_hash)
+
+def _prune_revoked(now: float) -> None:
+    global _next_revoke_prune
+    if now < _next_revoke_prune:
+        return
+    for sid in [sid for sid, until in _revoked_sessions.items() if until <= now]:
+        del _revoked_sessions[sid]
+    _next_revoke_prune = now + REVOKE_PRUNE_INTERVAL
+
+def revoke_access_session(sid: str) -> None:
+    now = time.monotonic()
+    _prune_revoked(now)
+    _revoked_sessions[sid] = now + REVOKE_TTL
+
+def is_access_revoked(payload: dict) -> bool:
+    sid = payload.get("sid")
+    if sid is None:
+        return False
+    until = _revoked_sessions.get(sid)
+    return until is not None and until > time.monotonic()
 
 def decode_token(token: str) -> dict:
-    try:
-        return jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
-    except ExpiredSignatureError:
-        raise ValueError("Expired token")
-    except InvalidTokenError:
-        raise ValueError("Invalid token")
\ No newline at end of file
+    """Verified claims of a token; raises jwt.InvalidTokenError (expired, malformed, bad signature)."""
+    # reject obvious garbage before hashing or HMAC work
+    if len(token) > MAX_TOKEN_LENGTH or token.count(".") != 2:
+        raise InvalidTokenError("Malformed token")
+    key = hashlib.sha256(token.encode()).digest()[:16]
+    now = time.time()
+    with _jwt_cache_lock:
+        hit = _jwt_cache.get(key)
+    if hit is not None:
+        exp, payload = hit
+        if exp > now:
+            return dict(payload)
+        with _jwt_cache_lock:
+            _jwt_cache.pop(key, None)
+
+    payload = jwt.decode(
+        token, settings.SECRET_KEY, algorithms=[ALGORITHM],
+        options={"require": REQUIRED_CLAIMS},
+    )
+
+    # Only successfully verified tokens are cached, and never beyond min(JWT_CACHE_TTL, exp).
+    exp = min(now + JWT_CACHE_TTL, float(payload["exp"]))
+    if exp > now:
+        with _jwt_cache_lock:
+            _jwt_cache[key] = (exp, payload)
+    return dict(payload)
@@ -1,17 +1,37 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
 from core.config import settings
 
 if not settings.DATABASE_URL:
     raise RuntimeError("DATABASE_URL not set")
 
-engine = create_engine(settings.DATABASE_URL, echo=False, pool_pre_ping=True, pool_size=5, max_overflow=5, future=True)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+def _async_url(raw: str) -> URL:
+    url = make_url(raw)
+    query = dict(url.query)
+    # asyncpg spells libpq's sslmode as ssl and has no channel_binding option
+    if "sslmode" in query:
+        query["ssl"] = query.pop("sslmode")
+    query.pop("channel_binding", None)
+    return url.set(drivername="postgresql+asyncpg", query=query)
+
+# Request handlers use the async engine; the sync one only serves startup DDL and the janitor.
+engine = create_async_engine(
+    _async_url(settings.DATABASE_URL),
+    echo=False,
+    pool_pre_ping=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+)
+SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+
+sync_engine = create_engine(settings.DATABASE_URL, echo=False, pool_pre_ping=True, pool_size=1, max_overflow=1, future=True)
+SyncSessionLocal = sessionmaker(bind=sync_engine, autoflush=False, autocommit=False, future=True)
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -1,12 +1,23 @@
 # db/models.py
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import CheckConstraint, Column, Integer, String, Boolean, DateTime, ForeignKey, Index, Text, Uuid, text
 from db.database import Base
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Covers the janitor scan; the partial predicate is ignored on non-PostgreSQL backends.
+        Index(
+            "ix_users_logout_login",
+            "last_logout_at",
+            "last_login_at",
+            postgresql_where=text("last_logout_at IS NOT NULL"),
+        ),
+        # Numbers are stored E.164 only, so token subjects can be looked up without re-parsing.
+        CheckConstraint("mobile LIKE '+%'", name="ck_users_mobile_e164"),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
     mobile = Column(String(32), unique=True, nullable=False)
     age = Column(Integer, nullable=True)
@@ -15,4 +26,42 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     last_login_at = Column(DateTime, nullable=True)
     last_logout_at = Column(DateTime, nullable=True)
-    is_deleted = Column(Boolean, default=False)
\ No newline at end of file
+    last_activity_at = Column(DateTime, nullable=True)
+    is_deleted = Column(Boolean, default=False)
+
+
+class Message(Base):
+    __tablename__ = "messages"
+    __table_args__ = (
+        # One direction of a conversation, newest first; history reads UNION ALL both directions.
+        Index("ix_msg_conv", "sender_id", "receiver_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    sender_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    receiver_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    content = Column(Text, nullable=True)
+    drive_file_id = Column(String(128), nullable=True)
+    drive_web_view = Column(String(512), nullable=True)
+    drive_web_content = Column(String(512), nullable=True)
+    media_type = Column(String(32), nullable=True)
+    media_mime = Column(String(128), nullable=True)
+    media_size = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    __table_args__ = (
+        # jti lookups use the UNIQUE constraint's index; logout revokes by session.
+        Index("ix_refresh_session", "session_id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    jti = Column(String(36), unique=True, nullable=False)
+    session_id = Column(Uuid, nullable=False)  # native 16-byte uuid on PostgreSQL
+    token = Column(String(64), nullable=False)  # HMAC-SHA256 of the token, never the token itself
+    revoked = Column(Boolean, default=False, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -8,16 +8,22 @@ from typing import Optional
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import or_
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import delete, or_, select
 
 from routes import auth_routes, user_routes, message_routes
+from core.activity import activity_flush_loop, flush_activity
 from core.config import settings
-from db.database import Base, engine, SessionLocal
+from db.database import Base, sync_engine, SyncSessionLocal
 from db.models import User
 
 log = logging.getLogger("uvicorn.error")
 
-app = FastAPI(title="Auth + Chat Backend (No OTP)", version="1.0")
+app = FastAPI(
+    title="Auth + Chat Backend (No OTP)",
+    version="1.0",
+    default_response_class=ORJSONResponse,
+)
 
 
 # ------------------------- CORS -------------------------
@@ -27,12 +33,26 @@ def _parse_origins(raw: str | None) -> list[str]:
     vals = [x.strip() for x in raw.split(",")]
     return [v for v in vals if v]
 
+class SetCORSMiddleware(CORSMiddleware):
+    """CORSMiddleware that checks explicit origins with a set lookup instead of a list scan."""
+
+    def __init__(self, app, allow_origins=(), **kwargs):
+        super().__init__(app, allow_origins=allow_origins, **kwargs)
+        self.allow_origins = frozenset(self.allow_origins)
+
+    def is_allowed_origin(self, origin: str) -> bool:
+        if self.allow_all_origins:
+            return True
+        if self.allow_origin_regex is not None and self.allow_origin_regex.fullmatch(origin):
+            return True
+        return origin in self.allow_origins
+
 allow_origins = _parse_origins(getattr(settings, "CORS_ALLOW_ORIGINS", "*"))
 # If wildcard, credentials must be False per browser spec
 allow_credentials = False if allow_origins == ["*"] else True
 
 app.add_middleware(
-    CORSMiddleware,
+    SetCORSMiddleware,
     allow_origins=allow_origins,
     allow_credentials=allow_credentials,
     allow_methods=["*"],
@@ -42,7 +62,7 @@ app.add_middleware(
 
 # ------------------------- DB bootstrap -------------------------
 # NOTE: Prefer Alembic for production migrations
-Base.metadata.create_all(bind=engine)
+Base.metadata.create_all(bind=sync_engine)
 
 
 # ------------------------- Routers -------------------------
@@ -75,6 +95,30 @@ def diag_env():
 #   last_logout_at IS NOT NULL
 #   AND (last_login_at IS NULL OR last_login_at <= last_logout_at)
 #   AND last_logout_at < cutoff
+JANITOR_BATCH_SIZE = 5000
+
+def _purge_stale_batch(cutoff: datetime) -> list[int]:
+    """Delete up to JANITOR_BATCH_SIZE stale users; blocking, so run it off the event loop."""
+    db = SyncSessionLocal()
+    try:
+        ids = db.execute(
+            select(User.id)
+            .where(
+                User.last_logout_at.isnot(None),
+                or_(User.last_login_at.is_(None), User.last_login_at <= User.last_logout_at),
+                User.last_logout_at < cutoff,
+            )
+            .limit(JANITOR_BATCH_SIZE)
+        ).scalars().all()
+        if ids:
+            db.execute(
+                delete(User).where(User.id.in_(ids)).execution_options(synchronize_session=False)
+            )
+            db.commit()
+        return ids
+    finally:
+        db.close()
+
 async def _janitor_loop():
     interval = 24 * 60 * 60  # once per day
     while True:
@@ -82,48 +126,42 @@ async def _janitor_loop():
             cutoff = datetime.now(timezone.utc) - timedelta(
                 days=settings.ACCOUNT_DELETE_AFTER_LOGOUT_DAYS
             )
-            db = SessionLocal()
-            stale: list[User] = (
-                db.query(User)
-                .filter(
-                    User.last_logout_at.isnot(None),
-                    or_(User.last_login_at.is_(None), User.last_login_at <= User.last_logout_at),
-                    User.last_logout_at < cutoff,
-                )
-                .all()
-            )
-            if stale:
-                ids = [u.id for u in stale]
-                for u in stale:
-                    db.delete(u)
-                db.commit()
-                log.info("Janitor: deleted %d user(s): %s", len(stale), ids)
-            else:
+            total = 0
+            while True:
+                ids = await asyncio.to_thread(_purge_stale_batch, cutoff)
+                if not ids:
+                    break
+                total += len(ids)
+                log.info("Janitor: deleted %d user(s): %s", len(ids), ids)
+            if not total:
                 log.info("Janitor: nothing to delete")
         except Exception as e:
             log.exception("Janitor error: %s", e)
-        finally:
-            try:
-                db.close()
-            except Exception:
-                pass
         await asyncio.sleep(interval)
 
 _bg: Optional[asyncio.Task] = None
+_activity_bg: Optional[asyncio.Task] = None
 
 @app.on_event("startup")
 async def on_startup():
-    global _bg
-    _bg = asyncio.create_task(_janitor_loop())
+    global _bg, _activity_bg
+    # With several workers/instances, enable the janitor on exactly one of them.
+    if settings.RUN_JANITOR:
+        _bg = asyncio.create_task(_janitor_loop())
+    _activity_bg = asyncio.create_task(activity_flush_loop())
     log.info("Startup OK. CORS origins=%s credentials=%s", allow_origins, allow_credentials)
 
 @app.on_event("shutdown")
 async def on_shutdown():
-    global _bg
-    if _bg and not _bg.done():
-        _bg.cancel()
-        try:
-            await _bg
-        except asyncio.CancelledError:
-            pass
-    log.info("Shutdown complete.")
\ No newline at end of file
+    for task in (_bg, _activity_bg):
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    try:
+        await flush_activity()
+    except Exception as e:
+        log.exception("Activity flush error: %s", e)
+    log.info("Shutdown complete.")
@@ -1,31 +1,65 @@
 # routes/auth_routes.py
 from __future__ import annotations
 
-import os
 import re
-import jwt
-from datetime import datetime, timedelta, timezone
+import uuid
+from datetime import datetime
 from typing import Optional, List
 
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel, field_validator
-from sqlalchemy import select, update
+from sqlalchemy import bindparam, func, lambda_stmt, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from passlib.context import CryptContext
+from sqlalchemy.orm import load_only
 
-from models import User
+from db.models import RefreshToken, User
 from db.database import get_db  # <-- your existing dependency
+from core.activity import record_activity
+from core.security import (
+    create_access_token,
+    create_refresh_token,
+    InvalidTokenError,
+    decode_token,
+    hash_password_async,
+    hash_refresh_token,
+    is_access_revoked,
+    password_needs_rehash,
+    revoke_access_session,
+    verify_password_async,
+    verify_refresh_token,
+)
 
 # ------------------------------------------------------------------------------
-# Settings (falls back to env if you don't have a settings module)
+# Constants
 # ------------------------------------------------------------------------------
-SECRET_KEY = os.getenv("SECRET_KEY", "change-this-secret")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
-REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
-JWT_ALG = "HS256"
-
-pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
-E164 = re.compile(r"^\+\d{8,15}$")
+E164 = re.compile(r"^\+\d{8,15}$", re.ASCII)
+GENDERS = frozenset({"male", "female", "other"})
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+# Transaction time in UTC as a naive timestamp, computed by PostgreSQL (DateTime columns are naive UTC).
+UTC_NOW = func.timezone("UTC", func.now())
+
+# Hot-path lookups built as lambda statements: SQLAlchemy compiles each once and
+# reuses the cached SQL, so executions only bind the parameter.
+USER_BY_MOBILE = lambda_stmt(lambda: select(User).where(User.mobile == bindparam("mobile")))
+# refresh/logout only read these columns of the token row
+REFRESH_BY_JTI = lambda_stmt(
+    lambda: select(RefreshToken)
+    .options(load_only(
+        RefreshToken.user_id, RefreshToken.session_id, RefreshToken.token,
+        RefreshToken.revoked, RefreshToken.expires_at,
+    ))
+    .where(RefreshToken.jti == bindparam("jti"))
+)
+REFRESH_WITH_USER_BY_JTI = lambda_stmt(
+    lambda: select(RefreshToken, User)
+    .join(User, User.id == RefreshToken.user_id)
+    .options(load_only(
+        RefreshToken.user_id, RefreshToken.session_id, RefreshToken.token,
+        RefreshToken.revoked, RefreshToken.expires_at,
+    ))
+    .where(RefreshToken.jti == bindparam("jti"))
+)
 
 # ------------------------------------------------------------------------------
 # Pydantic Schemas
@@ -51,7 +85,7 @@ class RegisterRequest(BaseModel):
         if v is None:
             return v
         g = v.lower()
-        if g not in {"male", "female", "other"}:
+        if g not in GENDERS:
             raise ValueError("gender must be male|female|other")
         return g
 
@@ -91,6 +125,10 @@ class TokenResponse(BaseModel):
     token_type: str = "bearer"
 
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
 class UserPublic(BaseModel):
     id: int
     name: str
@@ -100,26 +138,72 @@ class UserPublic(BaseModel):
 # ------------------------------------------------------------------------------
 # Helpers
 # ------------------------------------------------------------------------------
-def hash_password(plain: str) -> str:
-    return pwd_ctx.hash(plain)
-
-
-def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_ctx.verify(plain, hashed)
-
-
-def make_access_token(sub: str) -> str:
-    now = datetime.now(timezone.utc)
-    exp = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    payload = {"sub": sub, "type": "access", "iat": int(now.timestamp()), "exp": int(exp.timestamp())}
-    return jwt.encode(payload, SECRET_KEY, algorithm=JWT_ALG)
-
-
-def make_refresh_token(sub: str) -> str:
-    now = datetime.now(timezone.utc)
-    exp = now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    payload = {"sub": sub, "type": "refresh", "iat": int(now.timestamp()), "exp": int(exp.timestamp())}
-    return jwt.encode(payload, SECRET_KEY, algorithm=JWT_ALG)
+async def get_user_by_mobile(db: AsyncSession, mobile: str) -> Optional[User]:
+    return (await db.execute(USER_BY_MOBILE, {"mobile": mobile})).scalar_one_or_none()
+
+
+async def get_current_user(
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
+) -> User:
+    # resolved once per request, however many dependencies ask for it
+    user = getattr(request.state, "current_user", None)
+    if user is not None:
+        return user
+    payload = getattr(request.state, "jwt_payload", None)
+    if payload is None:
+        try:
+            payload = decode_token(token)
+        except InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid or expired token")
+        request.state.jwt_payload = payload
+    if payload.get("type") != "access" or is_access_revoked(payload):
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    # sub is the stored E.164 number we signed at login; look it up as-is, no re-normalising
+    user = await get_user_by_mobile(db, payload.get("sub"))
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    record_activity(user.id)
+    request.state.current_user = user
+    return user
+
+
+def issue_refresh_token(db: AsyncSession, user: User, session_id: uuid.UUID) -> str:
+    """Mint a refresh token for the session and stage its hashed row on the session."""
+    token, jti, exp = create_refresh_token(user.mobile)
+    db.add(RefreshToken(
+        user_id=user.id, jti=jti, session_id=session_id,
+        token=hash_refresh_token(token), expires_at=exp,
+    ))
+    return token
+
+
+def refresh_claims(token: str) -> dict:
+    try:
+        payload = decode_token(token)
+    except InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    if payload.get("type") != "refresh":
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    return payload
+
+
+async def load_refresh_token(db: AsyncSession, token: str) -> RefreshToken:
+    claims = refresh_claims(token)
+    rt = (await db.execute(REFRESH_BY_JTI, {"jti": claims.get("jti")})).scalar_one_or_none()
+    if not rt or not verify_refresh_token(token, rt.token):
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    return rt
+
+
+async def revoke_session(db: AsyncSession, session_id: uuid.UUID) -> None:
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.session_id == session_id)
+        .values(revoked=True)
+        .execution_options(synchronize_session=False)
+    )
 
 
 # ------------------------------------------------------------------------------
@@ -130,7 +214,7 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 @router.post("/register", response_model=UserPublic, status_code=201)
 async def register(payload: RegisterRequest, db: AsyncSession = Depends(get_db)):
     # existing?
-    exists = (await db.execute(select(User).where(User.mobile == payload.mobile))).scalar_one_or_none()
+    exists = await get_user_by_mobile(db, payload.mobile)
     if exists:
         raise HTTPException(status_code=409, detail="Mobile already registered")
 
@@ -139,33 +223,96 @@ async def register(payload: RegisterRequest, db: AsyncSession = Depends(get_db))
         mobile=payload.mobile.strip(),
         age=payload.age,
         gender=(payload.gender or None),
-        password_hash=hash_password(payload.password),
+        password_hash=await hash_password_async(payload.password),
     )
     db.add(user)
     await db.commit()
     await db.refresh(user)
-    return UserPublic(id=user.id, name=user.name, mobile=user.mobile)
+    return UserPublic.model_construct(id=user.id, name=user.name, mobile=user.mobile)
 
 
 @router.post("/login", response_model=TokenResponse)
 async def login(payload: LoginRequest, db: AsyncSession = Depends(get_db)):
     # find user
-    user = (await db.execute(select(User).where(User.mobile == payload.mobile))).scalar_one_or_none()
-    if not user or not verify_password(payload.password, user.password_hash):
+    user = await get_user_by_mobile(db, payload.mobile)
+    if not user or not await verify_password_async(payload.password, user.password_hash):
         # avoid user enumeration
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if password_needs_rehash(user.password_hash):
+        user.password_hash = await hash_password_async(payload.password)
 
-    # update last_login
     await db.execute(
-        update(User).where(User.id == user.id).values(last_login_at=datetime.now(timezone.utc))
+        update(User)
+        .where(User.id == user.id)
+        .values(last_login_at=UTC_NOW, last_activity_at=UTC_NOW, last_logout_at=None)
+        .execution_options(synchronize_session=False)
     )
+    session_id = uuid.uuid4()
+    refresh = issue_refresh_token(db, user, session_id=session_id)
     await db.commit()
 
-    access = make_access_token(str(user.id))
-    refresh = make_refresh_token(str(user.id))
+    access = create_access_token(user.mobile, uid=user.id, sid=str(session_id))
     return TokenResponse(access_token=access, refresh_token=refresh)
 
 
+@router.post("/refresh", response_model=TokenResponse)
+async def refresh_token(payload: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    claims = refresh_claims(payload.refresh_token)
+    # token row and its user in one round-trip
+    row = (await db.execute(REFRESH_WITH_USER_BY_JTI, {"jti": claims.get("jti")})).one_or_none()
+    if not row or not verify_refresh_token(payload.refresh_token, row[0].token):
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    rt, user = row
+
+    if rt.revoked:
+        # a rotated-out token came back: treat the whole session as compromised
+        await revoke_session(db, rt.session_id)
+        await db.commit()
+        revoke_access_session(str(rt.session_id))
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    if rt.expires_at <= datetime.utcnow():
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+    # rotate: old token is spent, new one slides the inactivity window forward
+    rt.revoked = True
+    await db.execute(
+        update(User)
+        .where(User.id == user.id)
+        .values(last_activity_at=UTC_NOW, last_logout_at=None)  # still signed in somewhere
+        .execution_options(synchronize_session=False)
+    )
+    refresh = issue_refresh_token(db, user, session_id=rt.session_id)
+    await db.commit()
+
+    access = create_access_token(user.mobile, uid=user.id, sid=str(rt.session_id))
+    return TokenResponse(access_token=access, refresh_token=refresh)
+
+
+@router.post("/logout")
+async def logout(payload: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    rt = await load_refresh_token(db, payload.refresh_token)
+    await revoke_session(db, rt.session_id)
+    # the account is only logged out once its last live session ends; the janitor keys on this
+    live_session = (
+        select(RefreshToken.id)
+        .where(
+            RefreshToken.user_id == rt.user_id,
+            RefreshToken.revoked == False,  # noqa: E712
+            RefreshToken.expires_at > UTC_NOW,
+        )
+        .exists()
+    )
+    await db.execute(
+        update(User)
+        .where(User.id == rt.user_id, ~live_session)
+        .values(last_logout_at=UTC_NOW)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    revoke_access_session(str(rt.session_id))
+    return {"ok": True}
+
+
 # Optional: very small preflight helpers (sometimes handy on certain hosts)
 @router.options("/login")
 async def options_login():
@@ -183,6 +330,7 @@ users_router = APIRouter(prefix="/users", tags=["users"])
 
 @users_router.get("", response_model=List[UserPublic])
 async def list_users(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(User).where(User.is_deleted == False))  # noqa: E712
-    rows = result.scalars().all()
-    return [UserPublic(id=u.id, name=u.name, mobile=u.mobile) for u in rows]
\ No newline at end of file
+    result = await db.execute(
+        select(User.id, User.name, User.mobile).where(User.is_deleted == False)  # noqa: E712
+    )
+    return [UserPublic.model_construct(id=u.id, name=u.name, mobile=u.mobile) for u in result]
\ No newline at end of file
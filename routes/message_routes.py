@@ -1,39 +1,76 @@
+import asyncio
+import orjson
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, timezone
 
 from db.database import get_db
 from db.models import Message, User
 from db.schemas import MessageOut
-from core.security import decode_token
-from sockets.chat_manager import ConnectionManager
-from core.gdrive import upload_bytes_to_drive
+from core.security import InvalidTokenError, decode_token, is_access_revoked
+from core.activity import record_activity
+from sockets.chat_manager import ConnectionManager, encode
+from core.gdrive import upload_stream_to_drive
 
 router = APIRouter()
 manager = ConnectionManager()
+WS_BATCH_MAX = 16
+WS_BATCH_WAIT = 0.005  # seconds
+_MISSING_FIELDS = encode({"error": "receiver_id and (content or drive_file_id) required"}).decode()
+_BAD_JSON = encode({"error": "bad json"}).decode()
+_BAD_FIELDS = encode({"error": "receiver_id and media_size must be integers"}).decode()
+_NOT_SAVED = encode({"error": "message could not be saved"}).decode()
 
-def user_from_token(token: str, db: Session) -> User:
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+async def user_id_from_mobile(db: AsyncSession, mobile: str) -> Optional[int]:
+    # a single int over the wire; no ORM instance to hydrate or track
+    return (await db.execute(select(User.id).where(User.mobile == mobile))).scalar_one_or_none()
+
+async def user_from_token(token: str, db: AsyncSession) -> int:
+    """Id of the token's user, checked to still exist in the database."""
+    try:
+        payload = decode_token(token)
+    except InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    if payload.get("type") != "access" or is_access_revoked(payload):
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    user_id = await user_id_from_mobile(db, payload["sub"])
+    # End the read transaction now so the pooled connection goes back. Callers keep the
+    # session for a whole socket or Drive upload and would otherwise sit idle in transaction.
+    await db.rollback()
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    record_activity(user_id)
+    return user_id
+
+def user_id_from_token(token: str) -> int:
+    """Sender id straight from the signed access token; no database round-trip."""
     try:
         payload = decode_token(token)
-        if payload.get("type") != "access":
-            raise Exception()
-        sub = payload["sub"]
-        user = db.query(User).filter(User.mobile == sub).first()
-        if not user:
-            raise Exception()
-        # bump activity
-        user.last_activity_at = datetime.utcnow()
-        db.add(user); db.commit()
-        return user
-    except Exception:
+    except InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
+    uid = payload.get("uid")
+    if payload.get("type") != "access" or is_access_revoked(payload) or not isinstance(uid, int):
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    record_activity(uid)
+    return uid
 
 @router.post("/messages/upload_gdrive")
-async def upload_gdrive(token: str = Form(...), file: UploadFile = File(...), db: Session = Depends(get_db)):
-    _ = user_from_token(token, db)
-    data = await file.read()
-    meta = upload_bytes_to_drive(filename=file.filename or "upload", data=data, mime_type=file.content_type or "application/octet-stream")
+async def upload_gdrive(token: str = Form(...), file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
+    await user_from_token(token, db)
+    # the Drive client is blocking; keep it off the event loop
+    meta = await asyncio.to_thread(
+        upload_stream_to_drive,
+        filename=file.filename or "upload",
+        stream=file.file,
+        mime_type=file.content_type or "application/octet-stream",
+        size=file.size,
+    )
     return {
         "file_id": meta.get("id"),
         "webViewLink": meta.get("webViewLink"),
@@ -52,66 +89,152 @@ async def send_message(
     media_type: Optional[str] = Form(None),
     media_mime: Optional[str] = Form(None),
     media_size: Optional[int] = Form(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = user_from_token(token, db)
+    user_id = user_id_from_token(token)
     if not content and not drive_file_id:
         raise HTTPException(status_code=400, detail="Provide content or drive_file_id")
 
-    msg = Message(
-        sender_id=user.id, receiver_id=receiver_id, content=content,
+    now = datetime.now(timezone.utc)
+    row = dict(
+        sender_id=user_id, receiver_id=receiver_id, content=content,
         drive_file_id=drive_file_id, drive_web_view=drive_web_view, drive_web_content=drive_web_content,
-        media_type=media_type, media_mime=media_mime, media_size=media_size
+        media_type=media_type, media_mime=media_mime, media_size=media_size,
+        created_at=now.replace(tzinfo=None),  # column is naive UTC
     )
-    db.add(msg); db.commit(); db.refresh(msg)
+    # created_at is ours, so RETURNING id is all we need; no refresh() round-trip
+    try:
+        msg_id = (await db.execute(insert(Message).values(**row).returning(Message.id))).scalar_one()
+        await db.commit()
+    except IntegrityError:
+        # a users FK failed; the sender comes from a uid claim and may have been deleted since
+        await db.rollback()
+        sender = (await db.execute(select(User.id).where(User.id == user_id))).scalar_one_or_none()
+        if sender is None:
+            raise HTTPException(status_code=401, detail="Invalid or expired token")
+        raise HTTPException(status_code=404, detail="Receiver not found")
 
-    await manager.send_personal(receiver_id, {
-        "id": msg.id, "from": user.id, "content": content,
+    await manager.send_personal_bytes(receiver_id, encode({
+        "id": msg_id, "from": user_id, "content": content,
         "drive_file_id": drive_file_id, "drive_web_view": drive_web_view, "drive_web_content": drive_web_content,
         "media_type": media_type, "media_mime": media_mime, "media_size": media_size,
-        "timestamp": msg.created_at.isoformat()
-    })
-    return msg
+        "timestamp": now,  # formatted by orjson
+    }))
+    return MessageOut.model_construct(id=msg_id, **row)
+
+async def _save_rows(db: AsyncSession, rows: list[dict]) -> list[Optional[int]]:
+    """Insert a burst with one INSERT ... RETURNING; ids in row order, None where a row was rejected."""
+    try:
+        result = await db.execute(
+            insert(Message).returning(Message.id, sort_by_parameter_order=True),
+            rows,
+        )
+        ids = list(result.scalars().all())
+        await db.commit()
+        return ids
+    except DBAPIError:
+        await db.rollback()
+    # one bad row (unknown receiver, oversized field) must not sink the rest of the burst
+    ids = []
+    for row in rows:
+        try:
+            ids.append((await db.execute(insert(Message).values(**row).returning(Message.id))).scalar_one())
+            await db.commit()
+        except DBAPIError:
+            await db.rollback()
+            ids.append(None)
+    return ids
+
+async def _receive(websocket: WebSocket) -> Optional[dict]:
+    """Next client frame (text or binary) decoded with orjson; None if it isn't a JSON object."""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    raw = message.get("text")
+    if raw is None:
+        raw = message.get("bytes")
+    try:
+        data = orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+async def _drain(websocket: WebSocket) -> tuple[list[Optional[dict]], bool]:
+    """Wait for one message, then collect any that follow within WS_BATCH_WAIT.
+
+    A disconnect mid-batch returns (batch, True) so the messages already read are still saved.
+    """
+    batch = [await _receive(websocket)]
+    while len(batch) < WS_BATCH_MAX:
+        try:
+            batch.append(await asyncio.wait_for(_receive(websocket), timeout=WS_BATCH_WAIT))
+        except asyncio.TimeoutError:
+            break
+        except WebSocketDisconnect:
+            return batch, True
+    return batch, False
 
 @router.websocket("/ws/chat")
-async def websocket_chat(websocket: WebSocket, token: str, db: Session = Depends(get_db)):
+async def websocket_chat(websocket: WebSocket, token: str, db: AsyncSession = Depends(get_db)):
     try:
-        user = user_from_token(token, db)
+        user_id = await user_from_token(token, db)
     except HTTPException:
         await websocket.close(code=4001); return
 
-    user_id = user.id
     await manager.connect(websocket, user_id)
 
     try:
-        while True:
-            data = await websocket.receive_json()
-            receiver_id = data.get("receiver_id")
-            content = data.get("content")
-            drive_file_id = data.get("drive_file_id")
-            drive_web_view = data.get("drive_web_view")
-            drive_web_content = data.get("drive_web_content")
-            media_type = data.get("media_type")
-            media_mime = data.get("media_mime")
-            media_size = data.get("media_size")
-
-            if not receiver_id or (not content and not drive_file_id):
-                await websocket.send_json({"error": "receiver_id and (content or drive_file_id) required"})
-                continue
-
-            msg = Message(
-                sender_id=user_id, receiver_id=receiver_id, content=content,
-                drive_file_id=drive_file_id, drive_web_view=drive_web_view, drive_web_content=drive_web_content,
-                media_type=media_type, media_mime=media_mime, media_size=media_size
-            )
-            db.add(msg); db.commit(); db.refresh(msg)
-
-            await manager.send_personal(receiver_id, {
-                "id": msg.id, "from": user_id, "content": content,
-                "drive_file_id": drive_file_id, "drive_web_view": drive_web_view, "drive_web_content": drive_web_content,
-                "media_type": media_type, "media_mime": media_mime, "media_size": media_size,
-                "timestamp": msg.created_at.isoformat()
-            })
-            await websocket.send_json({"status": "sent", "id": msg.id})
+        closed = False
+        while not closed:
+            batch, closed = await _drain(websocket)
+            rows = []
+            for data in batch:
+                if data is None:
+                    rows.append(_BAD_JSON)
+                    continue
+                receiver_id = data.get("receiver_id")
+                media_size = data.get("media_size")
+                if not receiver_id or (not data.get("content") and not data.get("drive_file_id")):
+                    rows.append(_MISSING_FIELDS)
+                    continue
+                if not _is_int(receiver_id) or (media_size is not None and not _is_int(media_size)):
+                    rows.append(_BAD_FIELDS)
+                    continue
+                # stamped per message: history sorts on created_at, so a burst must not tie
+                rows.append({
+                    "sender_id": user_id, "receiver_id": receiver_id, "content": data.get("content"),
+                    "drive_file_id": data.get("drive_file_id"), "drive_web_view": data.get("drive_web_view"),
+                    "drive_web_content": data.get("drive_web_content"), "media_type": data.get("media_type"),
+                    "media_mime": data.get("media_mime"), "media_size": media_size,
+                    "created_at": datetime.now(timezone.utc).replace(tzinfo=None),  # column is naive UTC
+                })
+
+            # ids line up with the valid rows; None marks one the database rejected
+            valid = [r for r in rows if isinstance(r, dict)]
+            saved = iter(await _save_rows(db, valid) if valid else ())
+
+            # replies go out in the order the client sent the messages; after a mid-batch
+            # disconnect recipients still get theirs, but nothing is written to this socket
+            for row in rows:
+                if isinstance(row, str):  # pre-encoded error frame
+                    if not closed:
+                        await websocket.send_text(row)
+                    continue
+                msg_id = next(saved)
+                if msg_id is None:
+                    if not closed:
+                        await websocket.send_text(_NOT_SAVED)
+                    continue
+                await manager.send_personal_bytes(row["receiver_id"], encode({
+                    "id": msg_id, "from": user_id, "content": row["content"],
+                    "drive_file_id": row["drive_file_id"], "drive_web_view": row["drive_web_view"],
+                    "drive_web_content": row["drive_web_content"],
+                    "media_type": row["media_type"], "media_mime": row["media_mime"], "media_size": row["media_size"],
+                    "timestamp": row["created_at"].replace(tzinfo=timezone.utc),
+                }))
+                if not closed:
+                    await websocket.send_text(encode({"status": "sent", "id": msg_id}).decode())
     except WebSocketDisconnect:
-        manager.disconnect(user_id)
\ No newline at end of file
+        pass
+    finally:
+        manager.disconnect(user_id, websocket)
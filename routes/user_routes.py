@@ -1,13 +1,24 @@
-from fastapi import APIRouter, Depends
+import hashlib
+from fastapi import APIRouter, Depends, Request, Response
 from typing import Annotated
-from sqlalchemy.orm import Session
-from db.database import get_db
 from db.schemas import UserOut
 from db.models import User
 from routes.auth_routes import get_current_user
 
 router = APIRouter()
 
+def user_etag(user: User) -> str:
+    # over exactly what UserOut exposes, so the tag changes only when the body would
+    created = user.created_at.isoformat() if user.created_at else ""
+    raw = f"{user.id}:{user.name}:{user.mobile}:{user.age}:{user.gender}:{created}"
+    return '"' + hashlib.blake2b(raw.encode(), digest_size=8).hexdigest() + '"'
+
 @router.get("/me", response_model=UserOut)
-def me(current_user: Annotated[User, Depends(get_current_user)], db: Session = Depends(get_db)):
-    return current_user
\ No newline at end of file
+async def me(request: Request, response: Response, current_user: Annotated[User, Depends(get_current_user)]):
+    etag = user_etag(current_user)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in (t.strip() for t in if_none_match.split(","))):
+        # unchanged: skip model validation and JSON encoding entirely
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return current_user
@@ -1,22 +1,53 @@
-from typing import Dict
+import asyncio
+from typing import Dict, List, Set, Tuple
+
+import orjson
 from fastapi import WebSocket
 
+BROADCAST_BATCH = 50
+
+def encode(data: dict) -> bytes:
+    """Serialise an outbound frame once; the bytes can be reused for every recipient."""
+    return orjson.dumps(data, option=orjson.OPT_UTC_Z)
+
 class ConnectionManager:
     def __init__(self):
-        self.active: Dict[int, WebSocket] = {}
+        # one user may be connected from several devices
+        self.active: Dict[int, Set[WebSocket]] = {}
 
     async def connect(self, websocket: WebSocket, user_id: int):
         await websocket.accept()
-        self.active[user_id] = websocket
+        self.active.setdefault(user_id, set()).add(websocket)
 
-    def disconnect(self, user_id: int):
-        self.active.pop(user_id, None)
+    def disconnect(self, user_id: int, websocket: WebSocket):
+        sockets = self.active.get(user_id)
+        if sockets is None:
+            return
+        sockets.discard(websocket)
+        if not sockets:
+            del self.active[user_id]
+
+    async def _fan_out(self, targets: List[Tuple[int, WebSocket]], text: str):
+        # send concurrently so one slow client can't hold up the rest; drop sockets that fail
+        results = await asyncio.gather(*(ws.send_text(text) for _, ws in targets), return_exceptions=True)
+        for (user_id, ws), result in zip(targets, results):
+            if isinstance(result, Exception):
+                self.disconnect(user_id, ws)
 
     async def send_personal(self, user_id: int, data: dict):
-        ws = self.active.get(user_id)
-        if ws:
-            await ws.send_json(data)
+        await self.send_personal_bytes(user_id, encode(data))
+
+    async def send_personal_bytes(self, user_id: int, payload: bytes):
+        sockets = self.active.get(user_id)
+        if sockets:
+            await self._fan_out([(user_id, ws) for ws in list(sockets)], payload.decode())
 
     async def broadcast(self, data: dict):
-        for ws in list(self.active.values()):
-            await ws.send_json(data)
\ No newline at end of file
+        await self.broadcast_bytes(encode(data))
+
+    async def broadcast_bytes(self, payload: bytes):
+        text = payload.decode()
+        targets = [(user_id, ws) for user_id, sockets in list(self.active.items()) for ws in list(sockets)]
+        for i in range(0, len(targets), BROADCAST_BATCH):
+            await self._fan_out(targets[i:i + BROADCAST_BATCH], text)
+            await asyncio.sleep(0)  # yield to the event loop between batches
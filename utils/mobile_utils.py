@@ -1,7 +1,29 @@
+from functools import lru_cache
 import phonenumbers
 from fastapi import HTTPException
 from core.config import settings
 
+# default region if number lacks '+'
+DEFAULT_REGION = settings.DEFAULT_COUNTRY.upper()
+
+# region is an argument, not read from DEFAULT_REGION inside, so it is part of the cache
+# key: the same local number under a different default country never hits a stale entry.
+@lru_cache(maxsize=8192)
+def _normalize_cached(msisdn: str, region: str) -> str:
+    # Only successful results are cached; failures raise ValueError and
+    # normalize_mobile turns them into a fresh HTTP 400.
+    try:
+        parsed = phonenumbers.parse(msisdn, region)
+    except phonenumbers.NumberParseException:
+        raise ValueError("Invalid phone number format")
+
+    # Validate actual phone number
+    if not phonenumbers.is_valid_number(parsed):
+        raise ValueError("Invalid or unsupported mobile number")
+
+    # Return standardized E.164 format (+<countrycode><number>)
+    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+
 def normalize_mobile(msisdn: str) -> str:
     """
     Normalize and validate a mobile number globally (E.164 format).
@@ -11,20 +33,7 @@ def normalize_mobile(msisdn: str) -> str:
       "00441234567890" -> "+441234567890"  (UK)
       "9876543210"     -> "+919876543210"  (uses default country if missing)
     """
-
-    msisdn = msisdn.strip()
-
-    # Try to parse the number globally; use default country if none provided
     try:
-        # default region if number lacks '+'
-        region = settings.DEFAULT_COUNTRY.upper() if hasattr(settings, "DEFAULT_COUNTRY") else "IN"
-        parsed = phonenumbers.parse(msisdn, region)
-    except phonenumbers.NumberParseException:
-        raise HTTPException(status_code=400, detail="Invalid phone number format")
-
-    # Validate actual phone number
-    if not phonenumbers.is_valid_number(parsed):
-        raise HTTPException(status_code=400, detail="Invalid or unsupported mobile number")
-
-    # Return standardized E.164 format (+<countrycode><number>)
-    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
\ No newline at end of file
+        return _normalize_cached(msisdn.strip(), DEFAULT_REGION)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))